@@ -1,11 +1,32 @@
+# Patch blocking stdlib I/O for gevent before anything else is imported
+from gevent import monkey
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
 import os
 import uuid
 import random
 import requests
+from requests.adapters import HTTPAdapter
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional, Tuple
+
+import gevent
+import orjson
+from cachetools import TTLCache
 
 from flask import Flask, request, jsonify, make_response, render_template
-from flask import Blueprint
+from flask import Blueprint, g, has_request_context
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Integer, cast, column, event, func, insert, select, text, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.orm import Session, raiseload, selectinload
 
 from keycloak_auth import keycloak_protect, check_role
 from models import Base, Poll, PollOption, Vote, VoteSelection
@@ -13,28 +34,156 @@ from mq import start_consumer, publish_event
 
 db = SQLAlchemy(model_class=Base)
 
+# Keep-alive connections to PermissionService, shared by all requests
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+http_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
 blueprint = Blueprint('blueprint', __name__)
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, with the default provider's sorted keys."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_SORT_KEYS),
+            mimetype="application/json",
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
 
+# Request bodies are small JSON documents; reject anything larger before parsing
+app.config["MAX_CONTENT_LENGTH"] = 16 * 1024
+
+# Connection pool for gevent workers, where every greenlet running a query
+# holds a connection. Keep
+#   GUNICORN_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW) * replicas
+# below the Postgres max_connections setting (100 by default). The defaults
+# give 2 * (5 + 5) = 20 connections per replica.
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+    "pool_use_lifo": True,
+    # Compiled SQL cache per engine; every route's statements should fit
+    "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "1200")),
+}
+
 db.init_app(app)
 
+# With DEBUG_QUERY_STATS=1 (dev/CI only), any relationship that a query did
+# not explicitly eager-load raises instead of lazy loading, and each
+# request's SQL statement count is tracked so N+1 regressions show up early.
+DEV_MODE = os.getenv("DEBUG_QUERY_STATS") == "1"
+
+# Statement count of the most recent request, per endpoint
+query_counts = {}
+
+# Compiled statement cache lookups since startup
+query_cache_stats = {"hits": 0, "misses": 0}
+
+if DEV_MODE:
+    @event.listens_for(Session, "do_orm_execute")
+    def _raise_on_lazy_load(orm_execute_state):
+        if (
+            orm_execute_state.is_select
+            and not orm_execute_state.is_column_load
+            and not orm_execute_state.is_relationship_load
+        ):
+            orm_execute_state.statement = orm_execute_state.statement.options(
+                raiseload("*", sql_only=True)
+            )
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.query_count = g.get("query_count", 0) + 1
+        if context.cache_hit is CacheStats.CACHE_HIT:
+            query_cache_stats["hits"] += 1
+        elif context.cache_hit is CacheStats.CACHE_MISS:
+            query_cache_stats["misses"] += 1
+
+# CORS headers added to every response, built once at import
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': "*",
+    'Access-Control-Allow-Methods': "*",
+    'Vary': "Origin",
+}
+
+@app.before_request
+def cors_preflight():
+    # Answer CORS preflights directly, before keycloak_protect and the view run
+    if request.method == "OPTIONS":
+        return "", 204, CORS_HEADERS
+
 @blueprint.after_request 
 def after_request(response):
     header = response.headers
-    header['Access-Control-Allow-Origin'] = '*'
-    header['Access-Control-Allow-Headers'] = "*"
-    header['Access-Control-Allow-Methods'] = "*"
+    header.update(CORS_HEADERS)
+    if DEV_MODE:
+        query_count = g.get("query_count", 0)
+        query_counts[request.endpoint] = query_count
+        header['X-Query-Count'] = str(query_count)
     # Other headers can be added here if needed
     return response
 
-# Root health check (for Kubernetes)
+if DEV_MODE:
+    # GET /debug/query-count - SQL statements issued by the last request to each endpoint
+    @blueprint.get("/debug/query-count")
+    def debug_query_count():
+        return jsonify(query_counts), 200
+
+    # GET /debug/query-cache - Compiled statement cache hits and misses
+    @blueprint.get("/debug/query-cache")
+    def debug_query_cache():
+        return jsonify(query_cache_stats), 200
+
+# Exact poll count shown on the root page, refreshed at most every 30s
+poll_count_cache = TTLCache(maxsize=1, ttl=30)
+
+# Root status page
 @blueprint.get("/")
 def root():
-    poll_count = db.session.query(Poll).count()
-    return "VotingService API running\n Poll count: {poll_count}".format(poll_count = poll_count)
+    if "count" not in poll_count_cache:
+        poll_count_cache["count"] = db.session.query(func.count(Poll.id)).scalar()
+    return "VotingService API running\n Poll count: {poll_count}".format(poll_count = poll_count_cache["count"])
+
+# Liveness probe (for Kubernetes): the process is serving requests
+@blueprint.get("/livez")
+def livez():
+    return "ok", 200
+
+# Readiness probe (for Kubernetes): the database is reachable
+@blueprint.get("/readyz")
+def readyz():
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception:
+        return "database unavailable", 503
+    return "ok", 200
+
+# GET /metrics - Estimated poll count from the planner statistics, which is
+# a single catalog row read instead of a full count(*) scan of polls
+@blueprint.get("/metrics")
+def metrics():
+    estimate = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+        {"table": Poll.__tablename__},
+    ).scalar()
+    # reltuples is -1 until the table has been vacuumed or analyzed
+    return jsonify({"poll_count_estimate": max(estimate or 0, 0)}), 200
 
 def on_event(event: dict):
     # event envelope: {event_type, data, ...}
@@ -48,23 +197,178 @@ def on_event(event: dict):
                 # expected payload: {"vote": {...}} OR just vote_data
                 vote_data = data.get("vote") or data
                 print(f"📥 Received voting.create event with data: {vote_data}")
-                result = create_poll_from_vote_data(vote_data)
-                print(f"✅ Successfully created poll: {result}")
+                result = create_poll_from_vote_data(vote_data, event_id=event.get("event_id"))
+                if result is None:
+                    print(f"↩️ Poll for event {event.get('event_id')} already exists, skipping")
+                else:
+                    print(f"✅ Successfully created poll: {result}")
             except Exception as e:
                 print(f"❌ Failed to create poll from vote data: {e}")
                 import traceback
                 traceback.print_exc()
 
+    elif et == "voting.vote_cast":
+        with app.app_context():
+            try:
+                poll = get_cached_poll(uuid.UUID(data["poll_id"]))
+                if poll:
+                    complete_poll_if_done(poll)
+            except Exception as e:
+                print(f"❌ Failed to check poll completion: {e}")
+                import traceback
+                traceback.print_exc()
+
+# voting.vote_cast drives poll completion, so it is always bound, even when
+# MQ_BINDINGS overrides the defaults
+MQ_BINDINGS = {rk for rk in os.getenv("MQ_BINDINGS", "voting.create").split(",") if rk}
+MQ_BINDINGS.add("voting.vote_cast")
+
 # Start consumer thread (after app exists)
 start_consumer(
     queue=os.getenv("MQ_QUEUE", "voting-service"),
-    bindings=os.getenv("MQ_BINDINGS", "voting.create").split(","),
+    bindings=sorted(MQ_BINDINGS),
     on_event=on_event,
 )
 
+@dataclass(frozen=True)
+class PollOptionSnapshot:
+    id: int
+    option_value: str
+
+
+@dataclass(frozen=True)
+class PollSnapshot:
+    id: int
+    uuid: uuid.UUID
+    meeting_id: str
+    poll_type: str
+    expected_voters: Optional[int]
+    options: Tuple[PollOptionSnapshot, ...]
+
+    @cached_property
+    def option_map(self):
+        """{option_value: option id}, built once per cached snapshot."""
+        return {opt.option_value: opt.id for opt in self.options}
+
+
+# Eligible voter counts per meeting, briefly cached so pages polling the
+# vote status don't each call PermissionService
+voters_cache = TTLCache(maxsize=1024, ttl=int(os.getenv("VOTERS_CACHE_TTL", "10")))
+
+def get_eligible_voters(meeting_id):
+    """Number of users with the vote role in a meeting, per PermissionService.
+
+    Returns None if the response is not a list of users. Raises
+    requests.exceptions.RequestException if the service is unavailable;
+    failures are not cached.
+    """
+    if meeting_id in voters_cache:
+        return voters_cache[meeting_id]
+
+    permission_base = os.getenv(
+        "PERMISSION_SERVICE_URL",
+        "http://permission-service.permission-service-dev.svc.cluster.local",
+    )
+    url = f"{permission_base}/meetings/{meeting_id}/roles/vote/users"
+    resp = http_session.get(url, timeout=5)
+    resp.raise_for_status()
+    users = resp.json()
+    eligible_voters = len(users) if isinstance(users, list) else None
+
+    voters_cache[meeting_id] = eligible_voters
+    return eligible_voters
+
+# Polls never change after creation apart from `completed`, so a snapshot of
+# the other columns and the ordered options is cached per process by UUID.
+poll_cache = TTLCache(maxsize=4096, ttl=int(os.getenv("POLL_CACHE_TTL", "60")))
+
+def get_cached_poll(poll_uuid_obj):
+    """Return a PollSnapshot for the given UUID, or None if no such poll exists."""
+    if poll_uuid_obj in poll_cache:
+        return poll_cache[poll_uuid_obj]
+
+    poll = db.session.scalar(
+        select(Poll).options(selectinload(Poll.options)).where(Poll.uuid == poll_uuid_obj)
+    )
+    if not poll:
+        # Misses are not cached, the poll may be created later
+        return None
+
+    snapshot = PollSnapshot(
+        id=poll.id,
+        uuid=poll.uuid,
+        meeting_id=poll.meeting_id,
+        poll_type=poll.poll_type,
+        expected_voters=poll.expected_voters,
+        options=tuple(
+            PollOptionSnapshot(id=opt.id, option_value=opt.option_value)
+            for opt in poll.options
+        ),
+    )
+    poll_cache[poll_uuid_obj] = snapshot
+    return snapshot
+
+def count_votes(poll):
+    """Return {option_value: votes} for a PollSnapshot from one GROUP BY query.
+
+    Ranked polls count first-choice votes (rank_order = 1) only.
+    """
+    query = db.session.query(
+        VoteSelection.poll_option_id, func.count()
+    ).filter(
+        VoteSelection.poll_option_id.in_([opt.id for opt in poll.options])
+    )
+    if poll.poll_type == "ranked":
+        query = query.filter(VoteSelection.rank_order == 1)
+    counts = dict(query.group_by(VoteSelection.poll_option_id).all())
+
+    return {opt.option_value: counts.get(opt.id, 0) for opt in poll.options}
+
+def complete_poll_if_done(poll):
+    """Mark a PollSnapshot's poll completed once all expected votes are in,
+    and notify the creator with a voting.completed event."""
+    total_votes = db.session.query(func.count(Vote.id)).filter(Vote.poll_id == poll.id).scalar()
+    expected = poll.expected_voters
+    print(f"Total votes: {total_votes}, Expected: {expected}")
+    if expected is None or total_votes < expected:
+        return
+
+    # mark completed and persist; the conditional update makes sure only
+    # one caller flips the flag and publishes the results
+    marked = db.session.query(Poll).filter(
+        Poll.id == poll.id,
+        Poll.completed.is_(False)
+    ).update({"completed": True}, synchronize_session=False)
+    db.session.commit()
+    if not marked:
+        return
+    print(f"Poll {poll.uuid} completed with {total_votes} votes.")
+
+    # build simple results summary
+    results = count_votes(poll)
+
+    event_data = {
+        "poll_id": str(poll.uuid),
+        "meeting_id": poll.meeting_id,
+        "results": results,
+        "total_votes": total_votes,
+    }
+    print(f"Publishing voting.completed event: {event_data}")
+    try:
+        publish_event("voting.completed", event_data)
+    except Exception:
+        # best-effort publish
+        pass
+
+# Matches the String(255) columns in models.py
+MAX_FIELD_LENGTH = 255
+
 # TODO: Should also verify meeting_uuid so it always matches an existing meeting
-def create_poll_from_vote_data(vote_data: dict):
-    # Validate required fields
+def _validate_create_poll(vote_data: dict) -> dict:
+    """Validate a poll creation payload without touching the database.
+
+    Returns the normalized fields or raises ValueError.
+    """
     meeting_id = vote_data.get("meeting_id")
     poll_id = vote_data.get("poll_id")
     poll_type = vote_data.get("pollType")
@@ -72,40 +376,87 @@ def create_poll_from_vote_data(vote_data: dict):
 
     if not meeting_id:
         raise ValueError("Missing 'meeting_id'")
-    # poll_id is optional. If provided, we'll use it as the DB id, otherwise let the DB assign one.
+    if len(str(meeting_id)) > MAX_FIELD_LENGTH:
+        raise ValueError(f"'meeting_id' must be at most {MAX_FIELD_LENGTH} characters")
+    # poll_id is optional. If provided, we'll use it as the poll UUID, otherwise
+    # it is derived from the event id (or assigned by the DB if there is none).
+    if poll_id is not None:
+        try:
+            poll_id = uuid.UUID(str(poll_id))
+        except ValueError:
+            raise ValueError("Invalid 'poll_id'. Must be a UUID")
     if poll_type not in ["single", "ranked"]:
         raise ValueError("Invalid 'pollType'. Must be 'single' or 'ranked'")
-    if not options or len(options) < 2:
+    if not isinstance(options, list) or len(options) < 2:
         raise ValueError("At least 2 options are required")
+    for option_value in options:
+        if not isinstance(option_value, str) or not option_value:
+            raise ValueError("Options must be non-empty strings")
+        if len(option_value) > MAX_FIELD_LENGTH:
+            raise ValueError(f"Options must be at most {MAX_FIELD_LENGTH} characters")
+    if len(set(options)) != len(options):
+        raise ValueError("Options must be unique")
+
+    return {
+        "meeting_id": meeting_id,
+        "poll_id": poll_id,
+        "poll_type": poll_type,
+        "options": options,
+        "expected_voters": vote_data.get("expected_voters"),
+    }
+
+# Namespace for poll UUIDs derived from voting.create event ids
+POLL_EVENT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "voting-service/voting.create")
+
+def create_poll_from_vote_data(vote_data: dict, event_id=None):
+    """Create a poll and its options, then publish voting.created.
+
+    voting.create events can be redelivered after the consumer reconnects,
+    so creation is idempotent: without a poll_id the poll UUID is derived
+    from event_id, and a poll whose UUID already exists is left untouched.
+    Returns None in that case.
+    """
+    # Validate everything up front so bad payloads never check out a DB connection
+    payload = _validate_create_poll(vote_data)
+    meeting_id = payload["meeting_id"]
+    poll_id = payload["poll_id"]
+    poll_type = payload["poll_type"]
+    options = payload["options"]
+    if poll_id is None and event_id:
+        poll_id = uuid.uuid5(POLL_EVENT_NAMESPACE, str(event_id))
 
     # Determine expected_voters: prefer provided value, otherwise ask PermissionService
-    expected_voters = vote_data.get("expected_voters")
+    expected_voters = payload["expected_voters"]
     if expected_voters is None:
         try:
-            permission_base = os.getenv(
-                "PERMISSION_SERVICE_URL",
-                "http://permission-service.permission-service-dev.svc.cluster.local",
-            )
-            url = f"{permission_base}/meetings/{meeting_id}/roles/vote/users"
-            resp = requests.get(url, timeout=5)
-            resp.raise_for_status()
-            users = resp.json()
-            if isinstance(users, list):
-                expected_voters = len(users)
+            expected_voters = get_eligible_voters(meeting_id)
         except requests.exceptions.RequestException:
             expected_voters = None
     print(f"Expected voters for poll (meeting_id={meeting_id}): {expected_voters}")
-    poll = Poll(uuid=poll_id, meeting_id=meeting_id, poll_type=poll_type, expected_voters=expected_voters)
-    db.session.add(poll)
-    db.session.flush()  # Flush to get the auto-generated poll.id
+    poll_values = {"meeting_id": meeting_id, "poll_type": poll_type, "expected_voters": expected_voters}
+    if poll_id is not None:
+        poll_values["uuid"] = poll_id
+    poll = db.session.execute(
+        pg_insert(Poll).values(**poll_values).on_conflict_do_nothing(
+            index_elements=["uuid"]
+        ).returning(Poll.id, Poll.uuid, Poll.meeting_id, Poll.poll_type)
+    ).first()
+
+    if poll is None:
+        # Already created, e.g. by an earlier delivery of the same event
+        db.session.rollback()
+        return None
     
-    # Now poll.id is available (either provided or auto-generated)
-    for index, option_value in enumerate(options):
-        db.session.add(PollOption(
-            poll_id=poll.id,  # Use poll.id instead of poll_id variable
-            option_value=option_value,
-            option_order=index,
-        ))
+    # Now poll.id is available (auto-generated).
+    # Insert all options in a single executemany round trip.
+    db.session.execute(insert(PollOption), [
+        {
+            "poll_id": poll.id,  # Use poll.id instead of poll_id variable
+            "option_value": option_value,
+            "option_order": index,
+        }
+        for index, option_value in enumerate(options)
+    ])
 
     db.session.commit()
 
@@ -130,15 +481,10 @@ def create_poll_from_vote_data(vote_data: dict):
     }
 
 # GET /polls/{poll_uuid}/ - Get poll information
-@blueprint.route("/polls/<poll_uuid>/", methods=["GET"])
+@blueprint.route("/polls/<uuid:poll_uuid>/", methods=["GET"])
 @keycloak_protect
 def get_poll(poll_uuid):
-    try:
-        poll_uuid_obj = uuid.UUID(poll_uuid)
-    except ValueError: 
-        return jsonify({"error": "Invalid poll UUID"}), 400
-    
-    poll = db.session.query(Poll).filter(Poll.uuid == poll_uuid_obj).first()
+    poll = get_cached_poll(poll_uuid)
     
     if not poll: 
         return jsonify({"error": "Poll not found"}), 404
@@ -150,12 +496,8 @@ def get_poll(poll_uuid):
     if not check_role(request.user, poll.meeting_id, "view"):
         return jsonify({"error": "Forbidden"}), 403
 
-    # Get poll options ordered by option_order
-    options = db.session.query(PollOption).filter(
-        PollOption.poll_id == poll.id
-    ).order_by(PollOption.option_order).all()
-    
-    option_values = [opt.option_value for opt in options]
+    # Poll options are ordered by option_order
+    option_values = [opt.option_value for opt in poll.options]
     
     return jsonify({
         "meeting_id": poll.meeting_id,
@@ -166,7 +508,7 @@ def get_poll(poll_uuid):
 
 # POST /polls/{poll_uuid}/vote - Vote on a poll
 # Probably out of scope but should votes be anonymized?
-@blueprint.route("/polls/<poll_uuid>/vote", methods=["POST"])
+@blueprint.route("/polls/<uuid:poll_uuid>/vote", methods=["POST"])
 @keycloak_protect
 def add_vote(poll_uuid):
     # Expects 
@@ -177,24 +519,28 @@ def add_vote(poll_uuid):
     #   ]
     # }
     
-    try:
-        poll_uuid_obj = uuid.UUID(poll_uuid)
-    except ValueError:
-        return jsonify({"error": "Invalid poll UUID"}), 400
-    
-    poll = db.session.query(Poll).filter(Poll.uuid == poll_uuid_obj).first()
-    
-    if not poll:
-        return jsonify({"error":  "Poll not found"}), 404
-    
-    data = request.get_json()
-    if not data or "vote" not in data: 
+    # Validate the request body before touching the database
+    data = request.get_json(silent=True, cache=False)
+    if not isinstance(data, dict):
+        data = {}
+
+    selected = data.get("vote")
+    if selected is None: 
         return jsonify({"error": "Missing 'vote' in request body"}), 400
     
-    selected = data.get("vote", [])
-    
     if not selected: 
         return jsonify({"error": "No options selected"}), 400
+
+    if not isinstance(selected, list) or not all(isinstance(option, str) for option in selected):
+        return jsonify({"error": "'vote' must be a list of options"}), 400
+
+    if len(set(selected)) != len(selected):
+        return jsonify({"error": "Each option can only be selected once"}), 400
+    
+    poll = get_cached_poll(poll_uuid)
+    
+    if not poll:
+        return jsonify({"error":  "Poll not found"}), 404
     
     user_id = request.user["preferred_username"]
     if not user_id: 
@@ -203,110 +549,94 @@ def add_vote(poll_uuid):
     if not check_role(request.user, poll.meeting_id, "vote"):
         return jsonify({"error": "Forbidden"}), 403
 
-    # Get valid poll options
-    poll_options = db.session.query(PollOption).filter(
-        PollOption.poll_id == poll.id
-    ).all()
-    option_map = {opt.option_value: opt.id for opt in poll_options}
+    # Valid poll options, mapped from value to id on the cached snapshot
+    option_map = poll.option_map
     
-    # Validate selected options
-    for option in selected:
-        if option not in option_map:
-            return jsonify({"error": f"Invalid option: {option}"}), 400
+    # Validate selected options, reporting every invalid one at once
+    invalid = [option for option in selected if option not in option_map]
+    if invalid:
+        return jsonify({"error": f"Invalid options: {', '.join(invalid)}"}), 400
     
     # Validate based on poll type
     if poll.poll_type == "single" and len(selected) > 1:
         return jsonify({"error": "Single choice poll allows only one selection"}), 400
     
-    # TODO: Verify so that for ranked votes you need to rank all options
-
-    # Check if user already voted
-    existing_vote = db.session.query(Vote).filter(
-        Vote.poll_id == poll.id,
-        Vote.user_id == user_id
-    ).first()
-    
-    if existing_vote:
-        return jsonify({"error":  "User has already voted on this poll"}), 409
-    
-    # Create the vote
-    vote = Vote(
+    # Selections are unique and valid, so matching the option count means
+    # every option has been ranked
+    if poll.poll_type == "ranked" and len(selected) != len(option_map):
+        return jsonify({"error": "Ranked poll requires all options to be ranked"}), 400
+
+    # Create the vote and its selections in one statement: a data-modifying
+    # CTE inserts the vote, and the outer INSERT ... SELECT adds one selection
+    # row per choice for the vote id it returns. The (poll_id, user_id) unique
+    # constraint makes the CTE return no row if the user already voted, in
+    # which case no selections are inserted either.
+    new_vote = pg_insert(Vote.__table__).values(
         poll_id=poll.id,
         user_id=user_id
-    )
-    db.session.add(vote)
-    db.session.flush()
+    ).on_conflict_do_nothing(
+        index_elements=["poll_id", "user_id"]
+    ).returning(Vote.__table__.c.id).cte("new_vote")
+
+    choices = values(
+        column("poll_option_id", Integer),
+        column("rank_order", Integer),
+        name="choices",
+    ).data([
+        (option_map[option_value], index + 1 if poll.poll_type == "ranked" else None)
+        for index, option_value in enumerate(selected)
+    ])
+
+    inserted = db.session.execute(
+        insert(VoteSelection.__table__).from_select(
+            ["vote_id", "poll_option_id", "rank_order"],
+            select(
+                new_vote.c.id,
+                choices.c.poll_option_id,
+                # Bare NULLs in VALUES default to text, so pin the type
+                cast(choices.c.rank_order, Integer),
+            ),
+        ).add_cte(new_vote).returning(VoteSelection.__table__.c.vote_id)
+    ).first()
     
-    # Create vote selections
-    for index, option_value in enumerate(selected):
-        poll_option_id = option_map[option_value]
-        rank_order = index + 1 if poll.poll_type == "ranked" else None
-        
-        vote_selection = VoteSelection(
-            vote_id=vote.id,
-            poll_option_id=poll_option_id,
-            rank_order=rank_order
-        )
-        db.session.add(vote_selection)
+    if inserted is None:
+        db.session.rollback()
+        return jsonify({"error":  "User has already voted on this poll"}), 409
     
     db.session.commit()
-    # After committing the vote, check if poll is complete and notify creator via MQ
-    try:
-        total_votes = db.session.query(Vote).filter(Vote.poll_id == poll.id).count()
-        expected = getattr(poll, "expected_voters", None)
-        print(f"Total votes: {total_votes}, Expected: {expected}")
-        if expected is not None and total_votes >= expected and not getattr(poll, "completed", False):
-            # mark completed and persist
-            print(f"Poll {poll.uuid} completed with {total_votes} votes.")
-            poll.completed = True
-            db.session.add(poll)
-            db.session.commit()
-
-            # build simple results summary
-            poll_options = db.session.query(PollOption).filter(PollOption.poll_id == poll.id).all()
-            results = {}
-            for option in poll_options:
-                if poll.poll_type == "single":
-                    count = db.session.query(VoteSelection).filter(
-                        VoteSelection.poll_option_id == option.id
-                    ).count()
-                else:
-                    count = db.session.query(VoteSelection).filter(
-                        VoteSelection.poll_option_id == option.id,
-                        VoteSelection.rank_order == 1
-                    ).count()
-                results[option.option_value] = count
+    # The completion check and results summary run on the MQ consumer
+    # (see on_event). Even the vote_cast publish runs in its own greenlet,
+    # so a slow or unreachable broker never delays the response.
+    gevent.spawn(announce_vote_cast, poll)
+
+    return jsonify({"message": "Vote recorded successfully"}), 200
 
-            event_data = {
+def announce_vote_cast(poll):
+    """Ask the MQ consumer to check whether the poll is complete.
+
+    Publishes with mandatory=True so an unroutable event raises too. If
+    the event cannot be delivered, the check runs here instead.
+    """
+    with app.app_context():
+        try:
+            publish_event("voting.vote_cast", {
                 "poll_id": str(poll.uuid),
                 "meeting_id": poll.meeting_id,
-                "results": results,
-                "total_votes": total_votes,
-            }
-            print(f"Publishing voting.completed event: {event_data}")
+            }, mandatory=True)
+        except Exception:
+            # MQ unavailable, check inline so the poll still completes
             try:
-                publish_event("voting.completed", event_data)
-            except Exception:
-                # best-effort publish; don't fail the request
-                pass
-
-    except Exception:
-        # If anything goes wrong while checking/completing, ignore to not break voting
-        pass
-
-    return jsonify({"message": "Vote recorded successfully"}), 200
+                complete_poll_if_done(poll)
+            except Exception as e:
+                # Never let the completion check break voting
+                print(f"❌ Failed to check poll completion: {e}")
 
 # GET /polls/{poll_uuid}/vote - Check whether the authenticated user has voted
-@blueprint.route("/polls/<poll_uuid>/vote", methods=["GET"])
+@blueprint.route("/polls/<uuid:poll_uuid>/vote", methods=["GET"])
 @keycloak_protect
 def has_voted(poll_uuid):
 
-    try:
-        poll_uuid_obj = uuid.UUID(poll_uuid)
-    except ValueError:
-        return jsonify({"error": "Invalid poll UUID"}), 400
-
-    poll = db.session.query(Poll).filter(Poll.uuid == poll_uuid_obj).first()
+    poll = get_cached_poll(poll_uuid)
     if not poll:
         return jsonify({"error": "Poll not found"}), 404
 
@@ -317,7 +647,7 @@ def has_voted(poll_uuid):
     if not check_role(request.user, poll.meeting_id, "vote"):
         return jsonify({"error": "Forbidden"}), 403
 
-    existing_vote = db.session.query(Vote).filter(
+    existing_vote = db.session.query(Vote.id).filter(
         Vote.poll_id == poll.id,
         Vote.user_id == user_id
     ).first()
@@ -326,16 +656,11 @@ def has_voted(poll_uuid):
 
 
 # GET /polls/{poll_uuid}/votes - Get vote count information
-@blueprint.route("/polls/<poll_uuid>/votes", methods=["GET"])
+@blueprint.route("/polls/<uuid:poll_uuid>/votes", methods=["GET"])
 @keycloak_protect
 def get_vote_count(poll_uuid):
 
-    try: 
-        poll_uuid_obj = uuid.UUID(poll_uuid)
-    except ValueError: 
-        return jsonify({"error": "Invalid poll UUID"}), 400
-    
-    poll = db.session.query(Poll).filter(Poll.uuid == poll_uuid_obj).first()
+    poll = get_cached_poll(poll_uuid)
     
     if not poll:
         return jsonify({"error": "Poll not found"}), 404
@@ -347,48 +672,18 @@ def get_vote_count(poll_uuid):
     if not check_role(request.user, poll.meeting_id, "vote"):
         return jsonify({"error": "Forbidden"}), 403
 
-    # Get all poll options
-    poll_options = db.session.query(PollOption).filter(
-        PollOption.poll_id == poll.id
-    ).order_by(PollOption.option_order).all()
-    
-    # Count votes for each option
-    votes = {}
-    for option in poll_options:
-        if poll.poll_type == "single":
-            # For single choice, count all selections
-            count = db.session.query(VoteSelection).filter(
-                VoteSelection.poll_option_id == option.id
-            ).count()
-        else:
-            # For ranked choice, count first-choice votes (rank_order = 1)
-            count = db.session.query(VoteSelection).filter(
-                VoteSelection.poll_option_id == option.id,
-                VoteSelection.rank_order == 1
-            ).count()
-        votes[option.option_value] = count
+    votes = count_votes(poll)
     
     # Get eligible voters from permission-service (role="vote").
     # If the permission service is unavailable, fall back to counting
     # already cast votes to avoid failing the endpoint.
     try:
-        permission_base = os.getenv(
-            "PERMISSION_SERVICE_URL",
-            "http://permission-service.permission-service-dev.svc.cluster.local",
-        )
-        url = f"{permission_base}/meetings/{poll.meeting_id}/roles/vote/users"
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        users = resp.json()
-        if isinstance(users, list):
-            eligible_voters = len(users)
-        else:
-            eligible_voters = 0
+        eligible_voters = get_eligible_voters(poll.meeting_id) or 0
     except requests.exceptions.RequestException:
-        # Graceful fallback: count unique users who have already voted
-        eligible_voters = db.session.query(Vote).filter(
-            Vote.poll_id == poll.id
-        ).count()
+        # Graceful fallback: count unique users who have already voted.
+        # Every vote has exactly one counted selection (its only choice, or
+        # its rank 1 choice), so the tallies already sum to the vote count.
+        eligible_voters = sum(votes.values())
     
     return jsonify({
         "eligible_voters": eligible_voters,
@@ -397,8 +692,11 @@ def get_vote_count(poll_uuid):
 
 app.register_blueprint(blueprint)
 
-with app.app_context():
-    db.create_all()
+# The schema is managed by Alembic (`alembic upgrade head`, run once per
+# deploy). Auto-creating tables is only meant for local development.
+if os.getenv("DEV_AUTO_CREATE"):
+    with app.app_context():
+        db.create_all()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=80)
\ No newline at end of file
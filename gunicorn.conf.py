@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:80")
+
+# Every request blocks on Postgres, Keycloak or PermissionService, so use
+# cooperative gevent workers instead of the default sync worker.
+worker_class = "gevent"
+# Each gevent worker already handles many concurrent requests, and every
+# worker opens its own DB pool (see SQLALCHEMY_ENGINE_OPTIONS in app.py).
+# cpu_count() reports the node's cores rather than the container's CPU
+# limit, so the default is a fixed, small worker count; raise it with
+# GUNICORN_WORKERS together with the pool settings.
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+accesslog = "-"
+errorlog = "-"
+
+# Load the app in each worker after forking, so every worker gets its own
+# HTTP sessions, DB pool, AMQP publisher connection and MQ consumer thread
+# instead of sharing sockets inherited from the master.
+preload_app = False
@@ -1,44 +1,78 @@
 # keycloak_auth.py
 
+from functools import wraps
+
 from flask import request, jsonify
 from jose import jwt
 import requests
-from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from cachetools import TLRUCache, TTLCache
+import hashlib
 import os
+import time
 
 # Keycloak Config
 KEYCLOAK_ISSUER = os.getenv("KEYCLOAK_ISSUER") 
 KEYCLOAK_JWKS_URL = f"{KEYCLOAK_ISSUER}/protocol/openid-connect/certs"
 KEYCLOAK_AUDIENCE = os.getenv("KEYCLOAK_AUDIENCE")
 
+# Keep-alive connections to Keycloak
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+http_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
 # Cache JWKS
 jwks_cache = TTLCache(maxsize=1, ttl=3600)
 
+# Minimum seconds between JWKS fetches forced by an unknown kid, so tokens
+# with made-up kids cannot make every request hit Keycloak
+JWKS_REFRESH_INTERVAL = 30
+_jwks_fetched_at = 0.0
+
+def _token_expiry(key, payload, now):
+    """Keep a verified token until its own `exp` claim."""
+    return payload.get("exp", now)
+
+# Cache verified token payloads, keyed by a hash of the token
+token_cache = TLRUCache(maxsize=4096, ttu=_token_expiry, timer=time.time)
+
 def get_jwks():
-    """Retrieve JWKS from Keycloak (cached for performance)."""
+    """Retrieve JWKS from Keycloak as {kid: key} (cached for performance)."""
+    global _jwks_fetched_at
     if "jwks" in jwks_cache:
         return jwks_cache["jwks"]
-    jwks = requests.get(KEYCLOAK_JWKS_URL).json()
-    jwks_cache["jwks"] = jwks
-    return jwks
+    _jwks_fetched_at = time.monotonic()
+    jwks = http_session.get(KEYCLOAK_JWKS_URL, timeout=5).json()
+    keys = {key["kid"]: key for key in jwks["keys"]}
+    jwks_cache["jwks"] = keys
+    return keys
 
 def get_signing_key(token):
-    jwks = requests.get(KEYCLOAK_JWKS_URL).json()
     header = jwt.get_unverified_header(token)
     kid = header["kid"]
 
-    for key in jwks["keys"]:
-        if key["kid"] == kid:
-            return key
+    key = get_jwks().get(kid)
+    if key is None and time.monotonic() - _jwks_fetched_at >= JWKS_REFRESH_INTERVAL:
+        # Unknown kid, Keycloak may have rotated its keys: refetch once,
+        # unless the keys were already fetched recently
+        jwks_cache.pop("jwks", None)
+        key = get_jwks().get(kid)
 
-    raise Exception("Public key not found in JWKS")
+    if key is None:
+        raise Exception("Public key not found in JWKS")
+    return key
 
 def verify_token(token):
-    """Verify and decode JWT using Keycloak public keys."""
+    """Verify and decode JWT using Keycloak public keys (cached until the token expires)."""
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return payload
+
     try:
         key = get_signing_key(token)
 
-        return jwt.decode(
+        payload = jwt.decode(
             token,
             key,
             algorithms=["RS256"],
@@ -48,23 +82,25 @@ def verify_token(token):
     except Exception as e:
         raise Exception(f"Invalid token: {e}")
 
+    token_cache[cache_key] = payload
+    return payload
+
 
 def keycloak_protect(f):
     """Flask decorator to protect routes using Keycloak JWT authentication."""
 
+    @wraps(f)
     def wrapper(*args, **kwargs):
         auth_header = request.headers.get("Authorization")
 
         if not auth_header:
             return jsonify({"error": "Authorization header missing"}), 401
 
-        parts = auth_header.split()
-
-        if parts[0].lower() != "bearer" or len(parts) != 2:
+        # The auth scheme is case-insensitive; slicing avoids splitting the header
+        token = auth_header[7:].strip()
+        if auth_header[:7].lower() != "bearer " or not token:
             return jsonify({"error": "Invalid Authorization header"}), 401
 
-        token = parts[1]
-
         try:
             user = verify_token(token)
             request.user = user  # attach decoded JWT payload
@@ -73,7 +109,6 @@ def keycloak_protect(f):
 
         return f(*args, **kwargs)
 
-    wrapper.__name__ = f.__name__
     return wrapper
 
 def check_role(user, meeting_uuid, role):
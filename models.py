@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, TIMESTAMP, func, CheckConstraint, UniqueConstraint, text
+    Column, Integer, String, ForeignKey, TIMESTAMP, func, CheckConstraint, UniqueConstraint, Index, text
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, declarative_base
@@ -24,7 +24,12 @@ class Poll(Base):
         CheckConstraint("poll_type IN ('single', 'ranked')", name="poll_type_check"),
     )
 
-    options = relationship("PollOption", back_populates="poll", cascade="all, delete-orphan")
+    options = relationship(
+        "PollOption",
+        back_populates="poll",
+        cascade="all, delete-orphan",
+        order_by="PollOption.option_order",
+    )
     votes = relationship("Vote", back_populates="poll", cascade="all, delete-orphan")
 
 
@@ -77,4 +82,7 @@ class VoteSelection(Base):
     __table_args__ = (
         UniqueConstraint('vote_id', 'poll_option_id', name='uix_voteselections_voteid_optionid'),
         UniqueConstraint('vote_id', 'rank_order', name='uix_voteselections_voteid_rank'),
+        # Vote tallies filter selections by option, and ranked polls only by first choice
+        Index('ix_vs_option', 'poll_option_id'),
+        Index('ix_vs_option_rank1', 'poll_option_id', postgresql_where=text('rank_order = 1')),
     )
\ No newline at end of file
@@ -1,62 +1,183 @@
-import os, json, uuid
+import os, threading, time, uuid
 from datetime import datetime, timezone
+import orjson
 import pika
 
 EXCHANGE = os.getenv("MQ_EXCHANGE", "events")
 EXCHANGE_TYPE = os.getenv("MQ_EXCHANGE_TYPE", "topic")
+PRODUCER = os.getenv("SERVICE_NAME", "unknown-service")
 
-def _conn():
-    return pika.BlockingConnection(pika.URLParameters(os.environ["AMQP_URL"]))
+def _conn(**overrides):
+    parameters = pika.URLParameters(os.environ["AMQP_URL"])
+    for name, value in overrides.items():
+        setattr(parameters, name, value)
+    return pika.BlockingConnection(parameters)
 
-def publish_event(routing_key: str, data: dict, *, event_version: int = 1):
-    connection = _conn()
-    ch = connection.channel()
-    ch.exchange_declare(exchange=EXCHANGE, exchange_type=EXCHANGE_TYPE, durable=True)
+# Publishing reuses one connection and channel per process. pika connections
+# are not thread-safe, so every use is serialized by _publish_lock.
+_publish_lock = threading.Lock()
+_publish_conn = None
+_publish_ch = None
 
+PUBLISH_ATTEMPTS = 3
+
+# Publisher connection limits (seconds). Publishes run while holding
+# _publish_lock, so an unreachable or blocked broker must fail fast instead
+# of stalling every other publish in the process.
+PUBLISH_SOCKET_TIMEOUT = 2
+PUBLISH_STACK_TIMEOUT = 5
+PUBLISH_BLOCKED_TIMEOUT = 5
+PUBLISH_HEARTBEAT = 10
+
+def _publish_channel():
+    """Return the shared publishing channel, reconnecting if it was closed."""
+    global _publish_conn, _publish_ch
+    if _publish_ch is None or not _publish_ch.is_open:
+        _close_publisher()
+        _publish_conn = _conn(
+            socket_timeout=PUBLISH_SOCKET_TIMEOUT,
+            stack_timeout=PUBLISH_STACK_TIMEOUT,
+            connection_attempts=1,
+            blocked_connection_timeout=PUBLISH_BLOCKED_TIMEOUT,
+            heartbeat=PUBLISH_HEARTBEAT,
+        )
+        _publish_ch = _publish_conn.channel()
+        # With confirms, basic_publish waits for the broker's ack and raises
+        # if the message was nacked, unroutable or the connection was lost
+        _publish_ch.confirm_delivery()
+        _publish_ch.exchange_declare(exchange=EXCHANGE, exchange_type=EXCHANGE_TYPE, durable=True)
+    else:
+        # Nothing services heartbeats while the connection sits idle; process
+        # pending frames first so a connection the broker already dropped
+        # raises here and is replaced
+        _publish_conn.process_data_events(time_limit=0)
+    return _publish_ch
+
+def _close_publisher():
+    global _publish_conn, _publish_ch
+    if _publish_conn is not None and _publish_conn.is_open:
+        try:
+            _publish_conn.close()
+        except pika.exceptions.AMQPError:
+            pass
+    _publish_conn = None
+    _publish_ch = None
+
+def publish_event(routing_key: str, data: dict, *, event_version: int = 1, mandatory: bool = False):
+    """Publish an event and wait for the broker to confirm it.
+
+    With mandatory=True, an event that no queue is bound to raises
+    pika.exceptions.UnroutableError instead of being dropped. Raises
+    pika.exceptions.AMQPError if the event could not be delivered.
+    """
     event = {
         "event_type": routing_key,
         "event_version": event_version,
         "event_id": str(uuid.uuid4()),
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "producer": os.getenv("SERVICE_NAME", "unknown-service"),
+        "producer": PRODUCER,
         "data": data,
     }
+    body = orjson.dumps(event)
 
-    ch.basic_publish(
-        exchange=EXCHANGE,
-        routing_key=routing_key,
-        body=json.dumps(event).encode("utf-8"),
-        properties=pika.BasicProperties(
-            content_type="application/json",
-            delivery_mode=2,
-        ),
-    )
-    connection.close()
+    with _publish_lock:
+        for attempt in range(PUBLISH_ATTEMPTS):
+            try:
+                _publish_channel().basic_publish(
+                    exchange=EXCHANGE,
+                    routing_key=routing_key,
+                    body=body,
+                    properties=pika.BasicProperties(
+                        content_type="application/json",
+                        delivery_mode=2,
+                    ),
+                    mandatory=mandatory,
+                )
+                return
+            except pika.exceptions.UnroutableError:
+                # Confirmed by the broker but not bound anywhere; retrying won't help
+                raise
+            except pika.exceptions.AMQPError:
+                # The broker may have dropped the idle connection; reconnect and retry
+                _close_publisher()
+                if attempt == PUBLISH_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
 
-def start_consumer(*, queue: str, bindings: list[str], on_event):
-    import threading
+# The broker streams up to MQ_PREFETCH_COUNT unacked messages; successful ones
+# are acked together, every MQ_ACK_BATCH_SIZE messages or after
+# ACK_FLUSH_SECONDS, whichever comes first. on_event must therefore be safe
+# to run again for messages redelivered after a dropped connection.
+PREFETCH_COUNT = int(os.getenv("MQ_PREFETCH_COUNT", "64"))
+ACK_BATCH_SIZE = int(os.getenv("MQ_ACK_BATCH_SIZE", "16"))
+ACK_FLUSH_SECONDS = 1.0
 
-    def _run():
-        connection = _conn()
+# Consumer connection liveness and reconnect backoff (seconds)
+CONSUMER_HEARTBEAT = 30
+CONSUMER_BLOCKED_TIMEOUT = 60
+RECONNECT_BACKOFF_MAX = 30
+
+def start_consumer(*, queue: str, bindings: list[str], on_event):
+    def _consume(on_connected):
+        connection = _conn(
+            heartbeat=CONSUMER_HEARTBEAT,
+            blocked_connection_timeout=CONSUMER_BLOCKED_TIMEOUT,
+        )
         ch = connection.channel()
 
         ch.exchange_declare(exchange=EXCHANGE, exchange_type=EXCHANGE_TYPE, durable=True)
         ch.queue_declare(queue=queue, durable=True)
+        ch.basic_qos(prefetch_count=PREFETCH_COUNT)
 
         for rk in bindings:
             ch.queue_bind(queue=queue, exchange=EXCHANGE, routing_key=rk)
+        on_connected()
+
+        # Highest delivery tag handled but not yet acked, and how many are pending
+        pending = {"tag": None, "count": 0}
+
+        def flush_acks():
+            if pending["tag"] is not None:
+                ch.basic_ack(delivery_tag=pending["tag"], multiple=True)
+                pending["tag"] = None
+                pending["count"] = 0
 
         def callback(ch_, method, properties, body):
             try:
-                event = json.loads(body.decode("utf-8"))
+                event = orjson.loads(body)
                 on_event(event)
-                ch_.basic_ack(delivery_tag=method.delivery_tag)
             except Exception:
+                flush_acks()
                 ch_.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                return
+
+            if pending["tag"] is None:
+                connection.call_later(ACK_FLUSH_SECONDS, flush_acks)
+            pending["tag"] = method.delivery_tag
+            pending["count"] += 1
+            if pending["count"] >= ACK_BATCH_SIZE:
+                flush_acks()
 
         ch.basic_consume(queue=queue, on_message_callback=callback, auto_ack=False)
         ch.start_consuming()
 
+    def _run():
+        # Reconnect whenever the broker connection drops, so voting.create
+        # events keep being consumed after a broker restart or network blip.
+        # Unacked messages are redelivered by the broker.
+        backoff = {"seconds": 1}
+
+        def reset_backoff():
+            backoff["seconds"] = 1
+
+        while True:
+            try:
+                _consume(reset_backoff)
+            except pika.exceptions.AMQPError as e:
+                print(f"MQ consumer disconnected ({e!r}), reconnecting in {backoff['seconds']}s")
+                time.sleep(backoff["seconds"])
+                backoff["seconds"] = min(backoff["seconds"] * 2, RECONNECT_BACKOFF_MAX)
+
     t = threading.Thread(target=_run, daemon=True)
     t.start()
-    return t
\ No newline at end of file
+    return t